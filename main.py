@@ -1,13 +1,18 @@
 import concurrent.futures
 import configparser
+import csv
+import hashlib
 import json
 import logging
+import os
 import queue
 import re
+import shutil
+import sys
 import threading
 import tkinter as tk
 import tkinter.font as font
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from logging.handlers import QueueHandler
 from pathlib import Path
 from tkinter import filedialog, messagebox, simpledialog
@@ -17,6 +22,8 @@ import pandas as pd
 import requests
 import ttkbootstrap as ttk
 from bs4 import BeautifulSoup
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import ERROR_CODES
 
 CONFIG_FILE = 'config.ini'
 CONFIG = {
@@ -27,9 +34,30 @@ CONFIG = {
     'HEADERS': {'User-Agent': 'Mozilla/5.0'},
     'FIO_JSON': 'teachers.json',
     'MAX_WORKERS': 4,
-    'OVERWRITE_CSV': False
+    'OVERWRITE_CSV': False,
+    'STORE_DIR': '.store',
+    'STORE_INDEX': 'index.json',
+    'EXPORT_FORMATS': ['csv', 'ics'],
+    'FEEDS_DIR': 'feeds',
+    'SEMESTER_START': None,
+    'SEMESTER_END': None,
+    'FIRST_WEEK_ODD': True,
+    'CHUNK_MEMORY_MB': 64,
+    'CHUNK_SAMPLE_ROWS': 1000
 }
 
+RESULT_COLUMNS = ['Преподаватель', 'Группа',
+                  'День (Четная)', 'Время (Четная)', 'Аудитория (Четная)', 'Тип (Четная)', 'Предмет (Четная)',
+                  'День (Нечетная)', 'Время (Нечетная)', 'Аудитория (Нечетная)', 'Тип (Нечетная)',
+                  'Предмет (Нечетная)']
+SOURCE_COLUMNS = ['Unnamed: 1'] + [f'Unnamed: {i}' for i in range(3, 13)]
+EXPORT_PREFIX = 'teacher_schedule_'
+ICS_TIMEZONE = 'Europe/Moscow'
+WEEKDAYS = {'по': 0, 'пн': 0, 'вт': 1, 'ср': 2, 'че': 3, 'чт': 3, 'пя': 4, 'пт': 4, 'су': 5, 'сб': 5, 'во': 6,
+            'вс': 6}
+
+store_lock = threading.Lock()
+
 log_queue = queue.Queue()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S',
                     handlers=[])
@@ -88,8 +116,130 @@ def validate_folder(folder_path):
         return False
 
 
-def download_file(file_url: str, save_path: Path, log_func: callable, cancel_event: threading.Event) -> Path | None:
+def get_store_dir(save_path):
+    return Path(save_path) / CONFIG['STORE_DIR']
+
+
+def load_store_index(save_path):
+    index_file = get_store_dir(save_path) / CONFIG['STORE_INDEX']
+    index = {'blobs': {}, 'urls': {}, 'names': {}}
+    try:
+        if index_file.exists():
+            with open(index_file, 'r', encoding='utf-8') as f:
+                index.update(json.load(f))
+    except Exception as e:
+        logger.error(f"Ошибка загрузки индекса хранилища: {e}")
+    return index
+
+
+def save_store_index(save_path, index):
+    store_dir = get_store_dir(save_path)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    index_file = store_dir / CONFIG['STORE_INDEX']
+    tmp_file = index_file.with_suffix('.tmp')
+    with store_lock:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, index_file)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_blob_path(save_path, content_hash, suffix):
+    return get_store_dir(save_path) / 'objects' / content_hash[:2] / f"{content_hash}{suffix.lower()}"
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def is_same_file(path, blob_path):
+    if not (path.exists() and blob_path.exists()):
+        return False
+    if path.samefile(blob_path):
+        return True
+    path_stat, blob_stat = path.stat(), blob_path.stat()
+    return path_stat.st_size == blob_stat.st_size and path_stat.st_mtime_ns == blob_stat.st_mtime_ns
+
+
+def link_friendly_name(blob_path, full_path):
+    if full_path.exists():
+        if is_same_file(full_path, blob_path):
+            return
+        full_path.unlink()
+    link_or_copy(blob_path, full_path)
+
+
+def add_to_store(src_path, content_hash, save_path, index, name, url=None, move=False):
+    suffix = Path(name).suffix
+    with store_lock:
+        known = index['blobs'].get(content_hash)
+        if known:
+            suffix = known['suffix']
+        blob_path = get_blob_path(save_path, content_hash, suffix)
+        is_new = not blob_path.exists()
+        if is_new:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            if move:
+                os.replace(src_path, blob_path)
+            else:
+                link_or_copy(src_path, blob_path)
+        elif move:
+            Path(src_path).unlink()
+        else:
+            link_friendly_name(blob_path, Path(src_path))
+        index['blobs'][content_hash] = {'suffix': suffix.lower(), 'size': blob_path.stat().st_size}
+        index['names'][name] = content_hash
+        if url:
+            index['urls'][url] = content_hash
+    return blob_path, is_new
+
+
+def collect_workbooks(save_path, log_func):
+    save_path = Path(save_path)
+    index = load_store_index(save_path)
+    workbooks = {}
+    files = sorted(f for f in save_path.glob("*.xls*") if not f.name.startswith(EXPORT_PREFIX))
+    for file in files:
+        try:
+            content_hash = index['names'].get(file.name)
+            blob_info = index['blobs'].get(content_hash) if content_hash else None
+            blob_path = get_blob_path(save_path, content_hash, blob_info['suffix']) if blob_info else None
+            if not (blob_path and is_same_file(file, blob_path)):
+                content_hash = file_sha256(file)
+                blob_path, _ = add_to_store(file, content_hash, save_path, index, file.name)
+            if content_hash in workbooks:
+                log_func(f"[Дубликат] {file.name} совпадает по содержимому с уже учтённым файлом")
+                continue
+            workbooks[content_hash] = blob_path
+        except OSError as e:
+            log_func(f"[Ошибка файла] {file}: {e}")
+    for url, content_hash in sorted(index['urls'].items()):
+        blob_info = index['blobs'].get(content_hash)
+        if content_hash in workbooks or not blob_info:
+            continue
+        blob_path = get_blob_path(save_path, content_hash, blob_info['suffix'])
+        if blob_path.exists():
+            workbooks[content_hash] = blob_path
+    save_store_index(save_path, index)
+    log_func(f"Уникальных расписаний: {len(workbooks)} (файлов в папке: {len(files)}, "
+             f"загруженных ссылок: {len(index['urls'])})")
+    return list(workbooks.values())
+
+
+def download_file(file_url: str, save_path: Path, log_func: callable, cancel_event: threading.Event,
+                  index: dict) -> Path | None:
     global filename
+    tmp_path = None
     try:
         filename = Path(file_url).name
         encoded_url = quote(file_url, safe='/:')
@@ -115,31 +265,49 @@ def download_file(file_url: str, save_path: Path, log_func: callable, cancel_eve
                 log_func(f"[Детали ошибки] Сервер вернул HTML: {error_text}")
             return None
 
-        if full_path.exists():
-            local_size = full_path.stat().st_size
-            if local_size == expected_size:
+        known_hash = index['urls'].get(file_url)
+        blob_info = index['blobs'].get(known_hash) if known_hash else None
+        if blob_info and blob_info['size'] == expected_size:
+            blob_path = get_blob_path(save_path, known_hash, blob_info['suffix'])
+            if blob_path.exists():
+                with store_lock:
+                    link_friendly_name(blob_path, full_path)
+                    index['names'][filename] = known_hash
                 log_func(f"[Пропущен] {filename} — уже загружен и размер совпадает")
                 return None
+        if full_path.exists() and full_path.stat().st_size == expected_size:
+            add_to_store(full_path, file_sha256(full_path), save_path, index, filename, url=file_url)
+            log_func(f"[Пропущен] {filename} — уже загружен и размер совпадает")
+            return None
 
+        tmp_dir = get_store_dir(save_path) / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = tmp_dir / f"{filename}.{threading.get_ident()}.part"
+        digest = hashlib.sha256()
         with requests.get(encoded_url, headers=CONFIG['HEADERS'], stream=True, allow_redirects=False) as r:
             r.raise_for_status()
-            with open(full_path, 'wb') as f:
+            with open(tmp_path, 'wb') as f:
                 total_size = 0
                 for chunk in r.iter_content(chunk_size=8192):
                     if cancel_event.is_set():
                         log_func(f"[Отменено] Загрузка {filename}")
-                        if full_path.exists():
-                            full_path.unlink()
                         return None
                     if chunk:
                         f.write(chunk)
+                        digest.update(chunk)
                         total_size += len(chunk)
-                if total_size != expected_size and expected_size > 0:
-                    log_func(
-                        f"[Ошибка] Размер файла {filename} не совпадает: ожидалось {expected_size}, получено {total_size}")
-                    full_path.unlink()
-                    return None
-        log_func(f"[Скачан] {filename} (размер: {total_size} байт)")
+            if total_size != expected_size and expected_size > 0:
+                log_func(
+                    f"[Ошибка] Размер файла {filename} не совпадает: ожидалось {expected_size}, получено {total_size}")
+                return None
+        blob_path, is_new = add_to_store(tmp_path, digest.hexdigest(), save_path, index, filename, url=file_url,
+                                         move=True)
+        with store_lock:
+            link_friendly_name(blob_path, full_path)
+        if is_new:
+            log_func(f"[Скачан] {filename} (размер: {total_size} байт)")
+        else:
+            log_func(f"[Дубликат] {filename} совпадает по содержимому с уже сохранённым файлом")
         return full_path
     except requests.exceptions.RequestException as e:
         log_func(f"[Ошибка сети] {filename}: {e}")
@@ -147,6 +315,9 @@ def download_file(file_url: str, save_path: Path, log_func: callable, cancel_eve
     except OSError as e:
         log_func(f"[Ошибка файла] {filename}: {e}")
         return None
+    finally:
+        if tmp_path and tmp_path.exists():
+            tmp_path.unlink()
 
 
 def download_excel_files(save_path, log_func, progress_callback=None, cancel_event=None):
@@ -180,9 +351,11 @@ def download_excel_files(save_path, log_func, progress_callback=None, cancel_eve
         log_func("⚠ Не найдено ссылок на Excel-файлы.")
         return []
 
+    all_links = list(dict.fromkeys(all_links))
+    index = load_store_index(save_path)
     downloaded_files = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['MAX_WORKERS']) as executor:
-        future_to_url = {executor.submit(download_file, url, save_path, log_func, cancel_event): url for url in
+        future_to_url = {executor.submit(download_file, url, save_path, log_func, cancel_event, index): url for url in
                          all_links}
         for future in concurrent.futures.as_completed(future_to_url):
             if cancel_event.is_set():
@@ -193,19 +366,132 @@ def download_excel_files(save_path, log_func, progress_callback=None, cancel_eve
                 downloaded_files.append(result)
             if progress_callback:
                 progress_callback(len(downloaded_files) / max(len(all_links), 1))
+    save_store_index(save_path, index)
     return downloaded_files
 
 
-def convert_to_csv(xl_file, log_func, cancel_event=None):
+def get_chunk_rows(bytes_per_row):
+    budget = CONFIG['CHUNK_MEMORY_MB'] * 1024 * 1024
+    return max(1, int(budget // max(bytes_per_row, 1)))
+
+
+def convert_excel_cell(value):
+    if isinstance(value, str) and value in ERROR_CODES:
+        return None
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_sheet_rows(sheet):
+    sheet.reset_dimensions()
+    for row in sheet.iter_rows(values_only=True):
+        values = [convert_excel_cell(value) for value in row]
+        while values and values[-1] == '':
+            values.pop()
+        yield values
+
+
+def build_header(values, width):
+    unnamed = [i for i in range(width) if i >= len(values) or values[i] in ('', None)]
+    names = [f"Unnamed: {i}" if i in unnamed else values[i] for i in range(width)]
+    counts = {}
+    for i in [i for i in range(width) if i not in unnamed] + unnamed:
+        name = old_name = names[i]
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[old_name] = count + 1
+            name = f"{old_name}.{count}"
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return [str(name) for name in names]
+
+
+# Rows are converted cell by cell, so the CSV can differ from read_excel + to_csv where pandas infers
+# a type for the whole column: NA-like and numeric-looking text ('NA', '01') is kept as is, ints in such
+# columns are not turned into floats, bool columns stay True/False and date-only datetimes keep 00:00:00.
+# Search reads the CSV back with pandas, so teacher matches are the same in both modes.
+def convert_sheet_chunked(sheet, csv_name, cancel_event=None):
+    width = 0
+    total_rows = 0
+    sample_rows = 0
+    sample_bytes = 0
+    filled = {}
+    not_numeric = set()
+    fractional = set()
+    for i, values in enumerate(iter_sheet_rows(sheet)):
+        if not values:
+            continue
+        width = max(width, len(values))
+        total_rows = i + 1
+        if not i:
+            continue
+        if sample_rows < CONFIG['CHUNK_SAMPLE_ROWS']:
+            sample_rows += 1
+            sample_bytes = max(sample_bytes, sum(sys.getsizeof(value) for value in values))
+        for col, value in enumerate(values):
+            if value in ('', None):
+                continue
+            filled[col] = filled.get(col, 0) + 1
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                not_numeric.add(col)
+            elif isinstance(value, float):
+                fractional.add(col)
+    data_rows = max(total_rows - 1, 0)
+    if not data_rows or not width:
+        return 0
+    float_columns = [col for col in range(width) if col not in not_numeric and
+                     (col in fractional or filled.get(col, 0) < data_rows)]
+
+    chunk_rows = get_chunk_rows(sys.getsizeof([''] * width) + sample_bytes)
+    tmp_name = csv_name.with_suffix('.csv.part')
+    rows = iter_sheet_rows(sheet)
+    try:
+        with open(tmp_name, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(build_header(next(rows), width))
+            chunk = []
+            for _, values in zip(range(data_rows), rows):
+                values += [''] * (width - len(values))
+                for col in float_columns:
+                    if isinstance(values[col], int):
+                        values[col] = float(values[col])
+                chunk.append(values)
+                if len(chunk) >= chunk_rows:
+                    if cancel_event and cancel_event.is_set():
+                        break
+                    writer.writerows(chunk)
+                    chunk.clear()
+            else:
+                writer.writerows(chunk)
+        if cancel_event and cancel_event.is_set():
+            return None
+        os.replace(tmp_name, csv_name)
+    finally:
+        if tmp_name.exists():
+            tmp_name.unlink()
+    return data_rows
+
+
+def convert_to_csv(xl_file, log_func, cancel_event=None, out_dir=None):
     xl_file = Path(xl_file)
-    base_dir = xl_file.parent
+    base_dir = Path(out_dir) if out_dir else xl_file.parent
     base_name = xl_file.stem
     csv_files = []
+    workbook = None
     try:
+        base_dir.mkdir(parents=True, exist_ok=True)
         log_func(f"Начало конвертации файла: {xl_file}")
-        xls = pd.ExcelFile(xl_file)
-        log_func(f"Найдено листов: {len(xls.sheet_names)}")
-        for sheet in xls.sheet_names:
+        if CONFIG['CHUNK_MEMORY_MB']:
+            workbook = load_workbook(xl_file, read_only=True, data_only=True)
+            sheet_names = workbook.sheetnames
+        else:
+            sheet_names = pd.ExcelFile(xl_file).sheet_names
+        log_func(f"Найдено листов: {len(sheet_names)}")
+        for sheet in sheet_names:
             if cancel_event and cancel_event.is_set():
                 log_func(f"[Отменено] Конвертация {xl_file}")
                 return csv_files
@@ -215,124 +501,474 @@ def convert_to_csv(xl_file, log_func, cancel_event=None):
                 csv_files.append(csv_name)
                 continue
             try:
-                df = pd.read_excel(xl_file, sheet_name=sheet, engine='openpyxl')
-                if df.empty:
+                if workbook is not None:
+                    rows = convert_sheet_chunked(workbook[sheet], csv_name, cancel_event)
+                    if rows is None:
+                        log_func(f"[Отменено] Конвертация {xl_file}")
+                        return csv_files
+                else:
+                    df = pd.read_excel(xl_file, sheet_name=sheet, engine='openpyxl')
+                    rows = 0 if df.empty else len(df)
+                if not rows:
                     log_func(f"[Пропущено] Лист '{sheet}' в {xl_file} пуст")
                     continue
-                df.to_csv(csv_name, index=False, encoding='utf-8')
+                if workbook is None:
+                    df.to_csv(csv_name, index=False, encoding='utf-8')
                 csv_files.append(csv_name)
-                log_func(f"[CSV создан] {csv_name} (строк: {len(df)})")
+                log_func(f"[CSV создан] {csv_name} (строк: {rows})")
             except Exception as e:
                 log_func(f"[Ошибка конвертации листа] {xl_file}, лист '{sheet}': {e}")
                 continue
     except Exception as e:
         log_func(f"[Ошибка открытия файла] {xl_file}: {e}")
+    finally:
+        if workbook is not None:
+            workbook.close()
     return csv_files
 
 
-def search_teachers_in_csv(csv_files, teacher_list, log_func, progress_callback=None, cancel_event=None):
+def infer_csv_dtypes(csv_file, columns, chunk_rows):
+    usecols = [col for col in SOURCE_COLUMNS if col in columns]
+    kinds = {}
+    with pd.read_csv(csv_file, encoding='utf-8', usecols=usecols, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            for col, dtype in chunk.dtypes.items():
+                kinds.setdefault(col, set()).add(dtype.kind)
+    return {col: float if found <= {'i', 'f'} else object for col, found in kinds.items() if len(found) > 1}
+
+
+def read_csv_chunks(csv_file):
+    if not CONFIG['CHUNK_MEMORY_MB']:
+        yield pd.read_csv(csv_file, encoding='utf-8')
+        return
+    sample = pd.read_csv(csv_file, encoding='utf-8', nrows=CONFIG['CHUNK_SAMPLE_ROWS'])
+    if len(sample) < CONFIG['CHUNK_SAMPLE_ROWS']:
+        yield sample
+        return
+    chunk_rows = get_chunk_rows(sample.memory_usage(deep=True).sum() / len(sample))
+    dtypes = infer_csv_dtypes(csv_file, sample.columns, chunk_rows)
+    del sample
+    with pd.read_csv(csv_file, encoding='utf-8', chunksize=chunk_rows, dtype=dtypes) as reader:
+        yield from reader
+
+
+def iter_search_results(csv_files, teacher_list, log_func, progress_callback=None, cancel_event=None):
     if not teacher_list:
         log_func("Ошибка: Список преподавателей пуст.")
-        return []
+        return
     teacher_pattern = re.compile('|'.join(map(re.escape, teacher_list)), re.IGNORECASE)
-    results = []
     for i, csv_file in enumerate(csv_files):
         if cancel_event and cancel_event.is_set():
             log_func("[Отменено] Поиск в CSV")
             break
         try:
-            df = pd.read_csv(csv_file, encoding='utf-8')
-            log_func(f"Заголовки столбцов в {csv_file}: {list(df.columns)}")
-            filename = Path(csv_file).stem
-            parts = filename.rsplit('_', 1)
-            group_name = parts[-1] if len(parts) > 1 else filename
-            if not re.match(r'[А-Яа-я]+-\d+[а-я]?', group_name):
-                log_func(f"[Предупреждение] Неверный формат имени группы: {group_name} в файле {filename}")
-            log_func(f"Извлечено имя группы: {group_name} из файла {filename}")
-            for _, row in df.iterrows():
+            group_name = None
+            for df in read_csv_chunks(csv_file):
+                if group_name is None:
+                    log_func(f"Заголовки столбцов в {csv_file}: {list(df.columns)}")
+                    filename = Path(csv_file).stem
+                    parts = filename.rsplit('_', 1)
+                    group_name = parts[-1] if len(parts) > 1 else filename
+                    if not re.match(r'[А-Яа-я]+-\d+[а-я]?', group_name):
+                        log_func(f"[Предупреждение] Неверный формат имени группы: {group_name} в файле {filename}")
+                    log_func(f"Извлечено имя группы: {group_name} из файла {filename}")
+                for _, row in df.iterrows():
+                    if cancel_event and cancel_event.is_set():
+                        log_func("[Отменено] Поиск в CSV")
+                        break
+                    row_dict = row.to_dict()
+                    teacher_cols = ['Unnamed: 6', 'Unnamed: 9']
+                    matching_teachers = []
+                    for col in teacher_cols:
+                        value = row_dict.get(col)
+                        if isinstance(value, str) and teacher_pattern.search(value):
+                            matching_teachers.extend([t for t in teacher_list if t.lower() in value.lower()])
+                    if matching_teachers:
+                        even_week = {
+                            'День': row_dict.get('Unnamed: 1', ''),
+                            'Время': row_dict.get('Unnamed: 12', ''),
+                            'Аудитория': row_dict.get('Unnamed: 11', ''),
+                            'Тип': row_dict.get('Unnamed: 10', ''),
+                            'Преподаватель': row_dict.get('Unnamed: 9', ''),
+                            'Предмет': row_dict.get('Unnamed: 8', '')
+                        }
+                        odd_week = {
+                            'День': row_dict.get('Unnamed: 1', ''),
+                            'Время': row_dict.get('Unnamed: 3', ''),
+                            'Аудитория': row_dict.get('Unnamed: 4', ''),
+                            'Тип': row_dict.get('Unnamed: 5', ''),
+                            'Преподаватель': row_dict.get('Unnamed: 6', ''),
+                            'Предмет': row_dict.get('Unnamed: 7', '')
+                        }
+                        yield {
+                            'Преподаватель': matching_teachers[0],
+                            'Группа': group_name,
+                            'Четная неделя': even_week,
+                            'Нечетная неделя': odd_week
+                        }
                 if cancel_event and cancel_event.is_set():
-                    log_func("[Отменено] Поиск в CSV")
                     break
-                row_dict = row.to_dict()
-                teacher_cols = ['Unnamed: 6', 'Unnamed: 9']
-                matching_teachers = []
-                for col in teacher_cols:
-                    value = row_dict.get(col)
-                    if isinstance(value, str) and teacher_pattern.search(value):
-                        matching_teachers.extend([t for t in teacher_list if t.lower() in value.lower()])
-                if matching_teachers:
-                    even_week = {
-                        'День': row_dict.get('Unnamed: 1', ''),
-                        'Время': row_dict.get('Unnamed: 12', ''),
-                        'Аудитория': row_dict.get('Unnamed: 11', ''),
-                        'Тип': row_dict.get('Unnamed: 10', ''),
-                        'Преподаватель': row_dict.get('Unnamed: 9', ''),
-                        'Предмет': row_dict.get('Unnamed: 8', '')
-                    }
-                    odd_week = {
-                        'День': row_dict.get('Unnamed: 1', ''),
-                        'Время': row_dict.get('Unnamed: 3', ''),
-                        'Аудитория': row_dict.get('Unnamed: 4', ''),
-                        'Тип': row_dict.get('Unnamed: 5', ''),
-                        'Преподаватель': row_dict.get('Unnamed: 6', ''),
-                        'Предмет': row_dict.get('Unnamed: 7', '')
-                    }
-                    results.append({
-                        'Преподаватель': matching_teachers[0],
-                        'Группа': group_name,
-                        'Четная неделя': even_week,
-                        'Нечетная неделя': odd_week
-                    })
         except Exception as e:
             log_func(f"[Ошибка CSV] {csv_file}: {e}")
         if progress_callback:
             progress_callback(i + 1, len(csv_files))
-    return results
 
 
-def format_results(results):
-    if not results:
-        return "Нет результатов."
-    output = [f"Найдено совпадений: {len(results)}\n"]
+def search_teachers_in_csv(csv_files, teacher_list, log_func, progress_callback=None, cancel_event=None):
+    return list(iter_search_results(csv_files, teacher_list, log_func, progress_callback, cancel_event))
+
+
+def clean_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    return value
+
+
+def flatten_result(result):
+    even_week = result['Четная неделя']
+    odd_week = result['Нечетная неделя']
+    row = {'Преподаватель': result['Преподаватель'], 'Группа': result['Группа']}
+    for key in ('День', 'Время', 'Аудитория', 'Тип', 'Предмет'):
+        row[f'{key} (Четная)'] = clean_value(even_week[key])
+        row[f'{key} (Нечетная)'] = clean_value(odd_week[key])
+    return {column: row[column] for column in RESULT_COLUMNS}
+
+
+def iter_formatted_results(results):
     for result in results:
-        teacher = result['Преподаватель']
-        group = result['Группа']
-        output.append(f"Преподаватель: {teacher}\nГруппа: {group}\n")
+        yield f"Преподаватель: {result['Преподаватель']}\nГруппа: {result['Группа']}\n"
         even_details = [f"{key}: {value}" for key, value in result['Четная неделя'].items() if
                         pd.notna(value) and value]
-        output.append("Четная неделя:\n" + "; ".join(even_details) + "\n")
+        yield "Четная неделя:\n" + "; ".join(even_details) + "\n"
         odd_details = [f"{key}: {value}" for key, value in result['Нечетная неделя'].items() if
                        pd.notna(value) and value]
-        output.append("Нечетная неделя:\n" + "; ".join(odd_details) + "\n")
-    return "\n".join(output)
+        yield "Нечетная неделя:\n" + "; ".join(odd_details) + "\n"
+
+
+def format_results(results):
+    if not results:
+        return "Нет результатов."
+    return "\n".join([f"Найдено совпадений: {len(results)}\n", *iter_formatted_results(results)])
+
+
+class CsvExporter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.file = None
+        self.writer = None
+
+    def write(self, result):
+        if self.writer is None:
+            self.file = open(self.output_file, 'w', encoding='utf-8', newline='')
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_COLUMNS, lineterminator=os.linesep)
+            self.writer.writeheader()
+        self.writer.writerow(flatten_result(result))
+
+    def close(self, complete=True):
+        if self.file is None:
+            return []
+        self.file.close()
+        return [self.output_file]
+
+
+class JsonlExporter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.file = None
+
+    def write(self, result):
+        if self.file is None:
+            self.file = open(self.output_file, 'w', encoding='utf-8')
+        self.file.write(json.dumps(flatten_result(result), ensure_ascii=False, default=str) + '\n')
+
+    def close(self, complete=True):
+        if self.file is None:
+            return []
+        self.file.close()
+        return [self.output_file]
+
+
+class XlsxExporter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.workbook = None
+        self.sheet = None
+
+    def write(self, result):
+        if self.workbook is None:
+            self.workbook = Workbook(write_only=True)
+            self.sheet = self.workbook.create_sheet('Расписание')
+            self.sheet.append(RESULT_COLUMNS)
+        row = flatten_result(result)
+        self.sheet.append([row[column] for column in RESULT_COLUMNS])
+
+    def close(self, complete=True):
+        if self.workbook is None:
+            return []
+        self.workbook.save(self.output_file)
+        return [self.output_file]
+
+
+class TextExporter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.part_file = output_file.with_suffix('.txt.part')
+        self.file = None
+        self.count = 0
+
+    def write(self, result):
+        if self.file is None:
+            self.file = open(self.part_file, 'w', encoding='utf-8')
+        for chunk in iter_formatted_results([result]):
+            self.file.write('\n' + chunk)
+        self.count += 1
+
+    def close(self, complete=True):
+        if self.file is None:
+            return []
+        self.file.close()
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            f.write(f"Найдено совпадений: {self.count}\n")
+            with open(self.part_file, 'r', encoding='utf-8') as part:
+                shutil.copyfileobj(part, f)
+        self.part_file.unlink()
+        return [self.output_file]
+
+
+def get_semester_bounds(today=None):
+    today = today or date.today()
+    if CONFIG['SEMESTER_START'] and CONFIG['SEMESTER_END']:
+        return date.fromisoformat(CONFIG['SEMESTER_START']), date.fromisoformat(CONFIG['SEMESTER_END'])
+    if today.month >= 8:
+        return date(today.year, 9, 1), date(today.year, 12, 31)
+    return date(today.year, 2, 1), date(today.year, 6, 30)
+
+
+def parse_lesson_time(value):
+    match = re.search(r'(\d{1,2})[.:](\d{2})\s*[-–—]\s*(\d{1,2})[.:](\d{2})', str(value))
+    if not match:
+        return None
+    h1, m1, h2, m2 = map(int, match.groups())
+    if not (0 <= h1 < 24 and 0 <= h2 < 24 and 0 <= m1 < 60 and 0 <= m2 < 60) or (h2, m2) <= (h1, m1):
+        return None
+    return (h1, m1), (h2, m2)
+
+
+def parse_weekday(value):
+    return WEEKDAYS.get(str(value).strip().lower()[:2])
+
+
+def escape_ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold_ics_line(line):
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    limit = 75
+    for char in line:
+        if len((current + char).encode('utf-8')) > limit:
+            parts.append(current)
+            current = ''
+            limit = 74
+        current += char
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def get_feed_path(feeds_dir, teacher):
+    safe_name = re.sub(r'[^\w.-]+', '_', teacher).strip('_')
+    return feeds_dir / f"{safe_name}.ics"
+
+
+def read_feed_hash(feed_path):
+    try:
+        with open(feed_path, 'r', encoding='utf-8', newline='') as f:
+            value = None
+            for line in f:
+                if value is not None:
+                    if not line.startswith(' '):
+                        return value
+                    value += line[1:].rstrip('\r\n')
+                elif line.startswith('X-RGUK-CONTENT-HASH:'):
+                    value = line.split(':', 1)[1].rstrip('\r\n')
+                elif line.startswith('BEGIN:VEVENT'):
+                    break
+            return value
+    except OSError:
+        pass
+    return None
+
+
+class IcsExporter:
+    def __init__(self, feeds_dir, teachers=(), log_func=None):
+        self.feeds_dir = Path(feeds_dir)
+        self.teachers = list(teachers)
+        self.log_func = log_func or log
+        self.semester_start, self.semester_end = get_semester_bounds()
+        self.dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.parts = {}
+        self.hashes = {}
+        self.uids = {}
+
+    def build_events(self, result):
+        week_start = self.semester_start - timedelta(days=self.semester_start.weekday())
+        for week_key, is_odd in (('Нечетная неделя', True), ('Четная неделя', False)):
+            lesson = {key: clean_value(value) for key, value in result[week_key].items()}
+            if not lesson['Предмет']:
+                continue
+            lesson_teacher = str(lesson['Преподаватель']).lower()
+            for teacher in self.teachers or [result['Преподаватель']]:
+                if teacher.lower() not in lesson_teacher:
+                    continue
+                event = self.build_event(teacher, result['Группа'], lesson, is_odd, week_start)
+                if event:
+                    yield teacher, event
+
+    def build_event(self, teacher, group, lesson, is_odd, week_start):
+        weekday = parse_weekday(lesson['День'])
+        lesson_time = parse_lesson_time(lesson['Время'])
+        if weekday is None or lesson_time is None:
+            self.log_func(f"[Пропущено в iCalendar] {teacher}, {group}: "
+                          f"не удалось разобрать день/время '{lesson['День']}' '{lesson['Время']}'")
+            return None
+        first_week_matches = is_odd == CONFIG['FIRST_WEEK_ODD']
+        first_day = week_start + timedelta(days=weekday + (0 if first_week_matches else 7))
+        if first_day < self.semester_start:
+            first_day += timedelta(days=14)
+        (h1, m1), (h2, m2) = lesson_time
+        start = datetime(first_day.year, first_day.month, first_day.day, h1, m1)
+        end = datetime(first_day.year, first_day.month, first_day.day, h2, m2)
+        week_name = 'нечетная' if is_odd else 'четная'
+        summary = f"{lesson['Предмет']} ({lesson['Тип']})" if lesson['Тип'] else str(lesson['Предмет'])
+        description = f"Группа: {group}; неделя: {week_name}"
+        uid_source = '|'.join(map(str, (teacher, group, week_name, lesson['День'], lesson['Время'],
+                                        lesson['Предмет'], lesson['Аудитория'])))
+        return [
+            'BEGIN:VEVENT',
+            f"UID:{hashlib.sha256(uid_source.encode('utf-8')).hexdigest()[:32]}@rguk-schedule",
+            f"DTSTART;TZID={ICS_TIMEZONE}:{start.strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND;TZID={ICS_TIMEZONE}:{end.strftime('%Y%m%dT%H%M%S')}",
+            f"RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL={self.semester_end.strftime('%Y%m%d')}T235959Z",
+            f"SUMMARY:{escape_ics_text(summary)}",
+            f"LOCATION:{escape_ics_text(lesson['Аудитория'])}",
+            f"DESCRIPTION:{escape_ics_text(description)}",
+            'END:VEVENT',
+        ]
+
+    def write(self, result):
+        for teacher, event in self.build_events(result):
+            uid = next(line for line in event if line.startswith('UID:'))
+            if uid in self.uids.setdefault(teacher, set()):
+                continue
+            self.uids[teacher].add(uid)
+            if teacher not in self.parts:
+                self.feeds_dir.mkdir(parents=True, exist_ok=True)
+                part_path = get_feed_path(self.feeds_dir, teacher).with_suffix('.ics.part')
+                self.parts[teacher] = open(part_path, 'w', encoding='utf-8', newline='')
+                self.hashes[teacher] = hashlib.sha256()
+            self.hashes[teacher].update('\n'.join(event).encode('utf-8'))
+            event.insert(2, f"DTSTAMP:{self.dtstamp}")
+            self.parts[teacher].write(''.join(fold_ics_line(line) for line in event))
+
+    def close(self, complete=True):
+        written = []
+        for teacher in dict.fromkeys(self.teachers + list(self.parts)):
+            feed_path = get_feed_path(self.feeds_dir, teacher)
+            part_file = self.parts.get(teacher)
+            part_path = feed_path.with_suffix('.ics.part')
+            if part_file:
+                part_file.close()
+            if not complete:
+                if part_file:
+                    part_path.unlink()
+                continue
+            if not part_file and not feed_path.exists():
+                continue
+            content_hash = self.hashes[teacher].hexdigest() if part_file else hashlib.sha256().hexdigest()
+            if read_feed_hash(feed_path) == content_hash:
+                self.log_func(f"[Без изменений] Календарь {feed_path.name}")
+                if part_file:
+                    part_path.unlink()
+                continue
+            self.write_feed(teacher, feed_path, part_path if part_file else None, content_hash)
+            written.append(feed_path)
+        return written
+
+    def write_feed(self, teacher, feed_path, part_path, content_hash):
+        header = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//RGUK Schedule//RU',
+            'CALSCALE:GREGORIAN',
+            f"X-WR-CALNAME:{escape_ics_text(teacher)}",
+            f"X-WR-TIMEZONE:{ICS_TIMEZONE}",
+            f"X-RGUK-CONTENT-HASH:{content_hash}",
+            'BEGIN:VTIMEZONE',
+            f"TZID:{ICS_TIMEZONE}",
+            'BEGIN:STANDARD',
+            'DTSTART:19700101T000000',
+            'TZOFFSETFROM:+0300',
+            'TZOFFSETTO:+0300',
+            'TZNAME:MSK',
+            'END:STANDARD',
+            'END:VTIMEZONE',
+        ]
+        tmp_path = feed_path.with_suffix('.ics.tmp')
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(''.join(fold_ics_line(line) for line in header))
+            if part_path:
+                with open(part_path, 'r', encoding='utf-8', newline='') as part:
+                    shutil.copyfileobj(part, f)
+            f.write(fold_ics_line('END:VCALENDAR'))
+        os.replace(tmp_path, feed_path)
+        if part_path:
+            part_path.unlink()
+        self.log_func(f"[Календарь обновлён] {feed_path}")
+
+
+class ResultExporter:
+    def __init__(self, save_path, formats=None, log_func=None, teachers=()):
+        save_path = Path(save_path)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_base = save_path / f"{EXPORT_PREFIX}{timestamp}"
+        self.exporters = []
+        for export_format in formats or CONFIG['EXPORT_FORMATS']:
+            if export_format == 'csv':
+                self.exporters.append(CsvExporter(output_base.with_suffix('.csv')))
+            elif export_format == 'jsonl':
+                self.exporters.append(JsonlExporter(output_base.with_suffix('.jsonl')))
+            elif export_format == 'xlsx':
+                self.exporters.append(XlsxExporter(output_base.with_suffix('.xlsx')))
+            elif export_format == 'txt':
+                self.exporters.append(TextExporter(output_base.with_suffix('.txt')))
+            elif export_format == 'ics':
+                self.exporters.append(IcsExporter(save_path / CONFIG['FEEDS_DIR'], teachers, log_func))
+            else:
+                raise ValueError(f"Неизвестный формат экспорта: {export_format}")
+
+    def write(self, result):
+        for exporter in self.exporters:
+            exporter.write(result)
+
+    def close(self, complete=True):
+        output_files = []
+        for exporter in self.exporters:
+            output_files.extend(exporter.close(complete))
+        return output_files
 
 
 def save_results_to_csv(results, save_path):
     if not results:
         return None
-    save_path = Path(save_path)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = save_path / f"teacher_schedule_{timestamp}.csv"
-    data = []
+    exporter = ResultExporter(save_path, ['csv'])
     for result in results:
-        row = {
-            'Преподаватель': result['Преподаватель'],
-            'Группа': result['Группа'],
-            'День (Четная)': result['Четная неделя']['День'],
-            'Время (Четная)': result['Четная неделя']['Время'],
-            'Аудитория (Четная)': result['Четная неделя']['Аудитория'],
-            'Тип (Четная)': result['Четная неделя']['Тип'],
-            'Предмет (Четная)': result['Четная неделя']['Предмет'],
-            'День (Нечетная)': result['Нечетная неделя']['День'],
-            'Время (Нечетная)': result['Нечетная неделя']['Время'],
-            'Аудитория (Нечетная)': result['Нечетная неделя']['Аудитория'],
-            'Тип (Нечетная)': result['Нечетная неделя']['Тип'],
-            'Предмет (Нечетная)': result['Нечетная неделя']['Предмет']
-        }
-        data.append(row)
-    df = pd.DataFrame(data)
-    df.to_csv(output_file, index=False, encoding='utf-8')
-    return output_file
+        exporter.write(result)
+    return exporter.close()[0]
 
 
 def load_teachers():
@@ -656,10 +1292,11 @@ class ScheduleApp:
                 messagebox.showwarning("Ошибка", "Добавьте хотя бы одного преподавателя.")
                 return
             log("🔍 Поиск преподавателей...")
-            all_files = [f for f in Path(self.folder_path.get()).glob("*.xls*")]
+            all_files = collect_workbooks(self.folder_path.get(), log)
             if not all_files:
                 log("⚠ Нет Excel-файлов в выбранной папке.")
                 return
+            csv_dir = get_store_dir(self.folder_path.get()) / 'csv'
             total_conversion = len(all_files)
             self.progress_var.set(0)
             all_csvs = []
@@ -667,7 +1304,7 @@ class ScheduleApp:
                 if self.cancel_event.is_set():
                     log("[Отменено] Конвертация Excel в CSV")
                     break
-                converted = convert_to_csv(file, log, self.cancel_event)
+                converted = convert_to_csv(file, log, self.cancel_event, out_dir=csv_dir)
                 all_csvs.extend(converted)
                 self.update_progress((i + 1) / total_conversion)
             total_search = len(all_csvs)
@@ -676,13 +1313,22 @@ class ScheduleApp:
             def search_progress(current, total):
                 self.update_progress(current / total)
 
-            self.results = search_teachers_in_csv(all_csvs, self.teachers, log, progress_callback=search_progress,
-                                                  cancel_event=self.cancel_event)
+            self.results = []
+            exporter = ResultExporter(self.folder_path.get(), log_func=log, teachers=self.teachers)
+            completed = False
+            try:
+                for result in iter_search_results(all_csvs, self.teachers, log, progress_callback=search_progress,
+                                                  cancel_event=self.cancel_event):
+                    self.results.append(result)
+                    exporter.write(result)
+                completed = not self.cancel_event.is_set()
+            finally:
+                output_files = exporter.close(complete=completed)
             if not self.results:
                 log("⚠ Преподаватели не найдены в расписании.")
             else:
-                output_file = save_results_to_csv(self.results, self.folder_path.get())
-                log(f"📋 Результаты сохранены в {output_file}")
+                for output_file in output_files:
+                    log(f"📋 Результаты сохранены в {output_file}")
                 log(f"📊 Найдено совпадений: {len(self.results)}")
             if not self.cancel_event.is_set():
                 log("✅ Поиск завершён.")
@@ -0,0 +1,92 @@
+import re
+import zipfile
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+openpyxl = pytest.importorskip('openpyxl')
+main = pytest.importorskip('main')
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    monkeypatch.setitem(main.CONFIG, 'CHUNK_MEMORY_MB', 0.001)
+    monkeypatch.setitem(main.CONFIG, 'CHUNK_SAMPLE_ROWS', 2)
+    monkeypatch.setitem(main.CONFIG, 'OVERWRITE_CSV', True)
+
+
+def make_schedule(path, rows=40):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'ИВТ-21'
+    ws.append(['Заголовок'])
+    for i in range(rows):
+        teacher = ['Иванов И.И.', 'Петров П.П.', None][i % 3]
+        ws.append([i, 'Понедельник', None, '9.00-10.30', 101 if i % 2 else None, 'лек', teacher, 'Физика',
+                   'Матем', teacher, 'пр', 201, '10.40-12.10'])
+    wb.save(path)
+
+
+def set_stale_dimension(path):
+    stale = path.with_name(f"stale_{path.name}")
+    with zipfile.ZipFile(path) as zin, zipfile.ZipFile(stale, 'w') as zout:
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            if item.filename.startswith('xl/worksheets/'):
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            zout.writestr(item, data)
+    return stale
+
+
+def test_chunked_conversion_ignores_stale_dimension(tmp_path, chunked):
+    make_schedule(tmp_path / 'schedule.xlsx', rows=5)
+    stale = set_stale_dimension(tmp_path / 'schedule.xlsx')
+
+    csv_files = main.convert_to_csv(stale, lambda message: None)
+
+    assert len(csv_files) == 1
+    expected = pd.read_excel(stale, engine='openpyxl')
+    assert pd.read_csv(csv_files[0]).equals(expected)
+
+
+def test_chunked_search_matches_full_load(tmp_path, chunked, monkeypatch):
+    make_schedule(tmp_path / 'schedule.xlsx')
+    chunked_csvs = main.convert_to_csv(tmp_path / 'schedule.xlsx', lambda message: None, out_dir=tmp_path / 'chunked')
+    chunked_results = main.search_teachers_in_csv(chunked_csvs, ['Иванов И.И.'], lambda message: None)
+
+    monkeypatch.setitem(main.CONFIG, 'CHUNK_MEMORY_MB', None)
+    full_csvs = main.convert_to_csv(tmp_path / 'schedule.xlsx', lambda message: None, out_dir=tmp_path / 'full')
+    full_results = main.search_teachers_in_csv(full_csvs, ['Иванов И.И.'], lambda message: None)
+
+    assert len(full_results) == 14
+    assert repr(chunked_results) == repr(full_results)
+
+
+def test_build_header_mangles_duplicates_like_pandas():
+    assert main.build_header(['x', 'x', 'x.1'], 3) == ['x', 'x.2', 'x.1']
+    assert main.build_header(['a', '', 'a'], 4) == ['a', 'Unnamed: 1', 'a.1', 'Unnamed: 3']
+
+
+class BrokenSheet:
+    def __init__(self, rows):
+        self.rows = rows
+        self.passes = 0
+
+    def reset_dimensions(self):
+        pass
+
+    def iter_rows(self, values_only=True):
+        self.passes += 1
+        for i, row in enumerate(self.rows):
+            if self.passes > 1 and i == 2:
+                raise OSError("corrupt row")
+            yield row
+
+
+def test_failed_chunked_write_leaves_no_part_file(tmp_path, chunked):
+    sheet = BrokenSheet([('Заголовок',)] + [(i, 'Понедельник') for i in range(10)])
+
+    with pytest.raises(OSError):
+        main.convert_sheet_chunked(sheet, tmp_path / 'sheet.csv')
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,96 @@
+import pytest
+
+main = pytest.importorskip('main')
+
+IVANOV = 'Иванов И.И.'
+PETROV = 'Петров П.П.'
+
+
+@pytest.fixture(autouse=True)
+def semester(monkeypatch):
+    monkeypatch.setitem(main.CONFIG, 'SEMESTER_START', '2026-09-01')
+    monkeypatch.setitem(main.CONFIG, 'SEMESTER_END', '2026-12-31')
+    monkeypatch.setitem(main.CONFIG, 'FIRST_WEEK_ODD', True)
+
+
+def make_result(odd_day='Понедельник', odd_time='9.00-10.30', odd_teacher=IVANOV,
+                even_day='Понедельник', even_time='10.40-12.10', even_teacher=IVANOV):
+    return {
+        'Преподаватель': IVANOV,
+        'Группа': 'ИВТ-21',
+        'Четная неделя': {'День': even_day, 'Время': even_time, 'Аудитория': 101, 'Тип': 'пр',
+                          'Преподаватель': even_teacher, 'Предмет': 'Математика'},
+        'Нечетная неделя': {'День': odd_day, 'Время': odd_time, 'Аудитория': 202, 'Тип': 'лек',
+                            'Преподаватель': odd_teacher, 'Предмет': 'Физика'},
+    }
+
+
+def export(tmp_path, results, complete=True, teachers=(IVANOV, PETROV), messages=None):
+    exporter = main.IcsExporter(tmp_path / 'feeds', teachers, (messages if messages is not None else []).append)
+    for result in results:
+        exporter.write(result)
+    return exporter.close(complete)
+
+
+def read_feed(tmp_path, teacher):
+    text = main.get_feed_path(tmp_path / 'feeds', teacher).read_text(encoding='utf-8')
+    return text.replace('\r\n ', '').splitlines()
+
+
+def test_events_are_anchored_to_week_parity(tmp_path):
+    export(tmp_path, [make_result(even_day='Вторник')])
+
+    lines = read_feed(tmp_path, IVANOV)
+    starts = [line for line in lines if line.startswith('DTSTART;')]
+    assert starts == ['DTSTART;TZID=Europe/Moscow:20260914T090000',
+                      'DTSTART;TZID=Europe/Moscow:20260908T104000']
+    assert lines.count('RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20261231T235959Z') == 2
+
+
+def test_every_matched_teacher_gets_the_lesson(tmp_path):
+    export(tmp_path, [make_result(even_teacher=PETROV)])
+
+    assert read_feed(tmp_path, IVANOV).count('BEGIN:VEVENT') == 1
+    assert read_feed(tmp_path, PETROV).count('BEGIN:VEVENT') == 1
+
+
+def test_repeated_lessons_are_written_once(tmp_path):
+    export(tmp_path, [make_result(), make_result()])
+
+    assert read_feed(tmp_path, IVANOV).count('BEGIN:VEVENT') == 2
+
+
+def test_unchanged_feed_is_not_rewritten(tmp_path):
+    assert export(tmp_path, [make_result()])
+    before = read_feed(tmp_path, IVANOV)
+
+    assert export(tmp_path, [make_result()]) == []
+    assert read_feed(tmp_path, IVANOV) == before
+
+
+def test_cancelled_export_leaves_feeds_untouched(tmp_path):
+    export(tmp_path, [make_result()])
+    before = read_feed(tmp_path, IVANOV)
+
+    assert export(tmp_path, [make_result(odd_day='Среда')], complete=False) == []
+    assert read_feed(tmp_path, IVANOV) == before
+    assert not list((tmp_path / 'feeds').glob('*.part'))
+
+
+def test_malformed_time_is_skipped(tmp_path):
+    messages = []
+    export(tmp_path, [make_result(odd_time='9.70-10.30', even_time='12.00-10.30')], messages=messages)
+
+    assert not main.get_feed_path(tmp_path / 'feeds', IVANOV).exists()
+    assert sum('[Пропущено в iCalendar]' in message for message in messages) == 2
+
+
+def test_text_export_matches_format_results(tmp_path):
+    results = [make_result(), make_result(even_teacher=PETROV)]
+    exporter = main.ResultExporter(tmp_path, ['txt'])
+    for result in results:
+        exporter.write(result)
+    output_file, = exporter.close()
+
+    assert output_file.read_text(encoding='utf-8') == main.format_results(results)
+    assert not list(tmp_path.glob('*.part'))
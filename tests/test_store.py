@@ -0,0 +1,123 @@
+import shutil
+import threading
+
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+main = pytest.importorskip('main')
+
+
+class FakeResponse:
+    def __init__(self, content=b'', fail_after=None):
+        self.content = content
+        self.fail_after = fail_after
+        self.status_code = 200
+        self.headers = {'Content-Length': str(len(content)),
+                        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            if self.fail_after is not None and start >= self.fail_after:
+                raise main.requests.exceptions.ConnectionError("connection reset")
+            yield self.content[start:start + chunk_size]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    files = {}
+    calls = []
+
+    def head(url, **kwargs):
+        return FakeResponse(files[url])
+
+    def get(url, **kwargs):
+        calls.append(url)
+        return FakeResponse(files[url], fail_after=files.get(('fail', url)))
+
+    monkeypatch.setattr(main.requests, 'head', head)
+    monkeypatch.setattr(main.requests, 'get', get)
+    return files, calls
+
+
+def download(url, save_path, index):
+    return main.download_file(url, save_path, lambda message: None, threading.Event(), index)
+
+
+def make_workbook(path, sheet='ИВТ-21'):
+    wb = openpyxl.Workbook()
+    wb.active.title = sheet
+    wb.active.append(['Заголовок'])
+    wb.active.append([1, 'Понедельник'])
+    wb.save(path)
+
+
+def test_duplicate_content_collapses_to_one_blob_and_csv(tmp_path):
+    make_workbook(tmp_path / 'a.xlsx')
+    shutil.copy(tmp_path / 'a.xlsx', tmp_path / 'b.xlsx')
+
+    workbooks = main.collect_workbooks(tmp_path, lambda message: None)
+    csv_dir = main.get_store_dir(tmp_path) / 'csv'
+    for workbook in workbooks:
+        main.convert_to_csv(workbook, lambda message: None, out_dir=csv_dir)
+
+    assert len(workbooks) == 1
+    assert len(list(csv_dir.glob('*.csv'))) == 1
+
+
+def test_redownload_by_url_is_skipped(tmp_path, server):
+    files, calls = server
+    url = 'https://rguk.ru/students/schedule/a.xlsx'
+    files[url] = b'workbook'
+    index = main.load_store_index(tmp_path)
+
+    assert download(url, tmp_path, index) == tmp_path / 'a.xlsx'
+    assert download(url, tmp_path, index) is None
+    assert calls == [url]
+
+
+def test_failed_download_leaves_no_part_file(tmp_path, server):
+    files, calls = server
+    url = 'https://rguk.ru/students/schedule/a.xlsx'
+    files[url] = b'x' * 20000
+    files[('fail', url)] = 8192
+
+    assert download(url, tmp_path, main.load_store_index(tmp_path)) is None
+    assert not list((main.get_store_dir(tmp_path) / 'tmp').iterdir())
+    assert not (tmp_path / 'a.xlsx').exists()
+
+
+def test_colliding_friendly_names_are_both_searched(tmp_path, server):
+    files, calls = server
+    first = 'https://rguk.ru/students/schedule/a.xlsx'
+    second = 'https://rguk.ru/upload/iblock/a.xlsx'
+    files[first] = b'first'
+    files[second] = b'second'
+    index = main.load_store_index(tmp_path)
+    download(first, tmp_path, index)
+    download(second, tmp_path, index)
+    main.save_store_index(tmp_path, index)
+
+    assert len(main.collect_workbooks(tmp_path, lambda message: None)) == 2
+
+
+def test_copied_files_are_not_rehashed(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise OSError("hardlinks are not supported")
+
+    monkeypatch.setattr(main.os, 'link', no_link)
+    make_workbook(tmp_path / 'a.xlsx')
+    main.collect_workbooks(tmp_path, lambda message: None)
+
+    hashed = []
+    monkeypatch.setattr(main, 'file_sha256', lambda path: hashed.append(path))
+    assert len(main.collect_workbooks(tmp_path, lambda message: None)) == 1
+    assert hashed == []